@@ -1,12 +1,12 @@
 import pytrendline
 import pandas as pd
-import os
+import pathlib
 import time
+import webbrowser
 
 # 1. Construct candlestick data. This example just grabs data from a fixture
-candles_df = pd.read_csv('./fixtures/example.csv')
+candles_df = pd.read_csv('./fixtures/example.csv', parse_dates=['Date'])
 candles_df.set_index('Idx')
-candles_df['Date'] = pd.to_datetime(candles_df['Date'])
 
 
 candlestick_data = pytrendline.CandlestickData(
@@ -61,4 +61,4 @@ outf = pytrendline.plot(
 )
 
 print("💾 Trendline results saved in {}".format(outf))
-os.system("open " + outf)
\ No newline at end of file
+webbrowser.open(pathlib.Path(outf).resolve().as_uri())
\ No newline at end of file
@@ -22,7 +22,7 @@ def get_candlestick_data(time_interval, csv_string):
 def get_candlestick_df(csv_string):
   csv_string = csv_string.strip()
 
-  df = pd.read_csv(io.StringIO(csv_string), delim_whitespace=True)
+  df = pd.read_csv(io.StringIO(csv_string), delim_whitespace=True, parse_dates=['Date'])
   df.Idx    = df.Idx.astype(int)
   df.Open   = df.Open.astype(float)
   df.Close  = df.Close.astype(float)
@@ -32,8 +32,6 @@ def get_candlestick_df(csv_string):
 
   df.set_index('Idx')
   df.reset_index(level=0, inplace=True)
-
-  df['Date'] = pd.to_datetime(df['Date'])
   return df
 
 
@@ -180,4 +178,15 @@ Date           Idx     Low     High   Open   Close   Volume
 2019-07-25     3       200     300    240    260     100000
 2019-07-26     4       200     300    240    260     100000
 2019-07-27     5       180     320    240    260     100000
-''')
\ No newline at end of file
+''')
+
+# Same candles as FLAT_RES_AND_SUP, except the data source repeated a timestamp
+DUPLICATE_DATE_1d = get_candlestick_data('1d','''
+Date           Idx     Low     High   Open   Close   Volume
+2019-07-22     0       230     270    240    260     100000
+2019-07-23     1       200     300.02 240    260     100000
+2019-07-23     2       199.97  270    240    260     100000
+2019-07-25     3       230     299.99 240    260     100000
+2019-07-26     4       200.02  270    240    260     100000
+2019-07-27     5       230     300    240    260     100000
+''')
@@ -72,27 +72,31 @@ def get_pivots(
   first_index = pseries.index[0]
   last_index = pseries.index[-1]
 
+  # For every candle, whether its price groups with the next candle's price
+  prices = candlestick_data.df[col].to_numpy()
+  groups_with_next = (np.abs(np.diff(prices)) < grouping_thres).tolist()
+  prices = prices.tolist()
+
   for i in range(first_index+1,last_index):
-    pcur = pseries[i]
-    pprev = pseries[i-1]
+    pcur = prices[i]
 
     j = 1
     while j < max_number_continuous_pivots and (i + j) < len(pseries) - 1:
-      if abs(pseries[i + j - 1] - pseries[i + j]) < grouping_thres:
+      if groups_with_next[i + j - 1]:
         j += 1
       else:
         break
 
-    pnext = pseries[i + j]
+    pnext = prices[i + j]
 
     j = 1
     while j < max_number_continuous_pivots and (i - j) > first_index:
-      if abs(pseries[i - j + 1] - pseries[i - j]) < grouping_thres:
+      if groups_with_next[i - j]:
         j += 1
       else:
         break
     
-    pprev = pseries[i - j]
+    pprev = prices[i - j]
 
     if trend_type == structs.TrendlineTypes.RESISTANCE and \
       (pprev > pcur or pnext > pcur): continue
@@ -145,6 +149,62 @@ def detect(
   # Console print debugs
   debug=False
 ):
+  # Input validation
+  if candlestick_data == None:
+    raise Exception("No candlestick data provided")
+  elif type(candlestick_data) != structs.CandlestickData:
+    raise Exception("candlestick_data input provided is of invalid type. See README for instructions")
+
+  # Cache avg_candle_range on candlestick_data while this call runs, cleared once it returns
+  candlestick_data._avg_candle_range = None
+  candlestick_data._avg_candle_range = util.avg_candle_range(candlestick_data)
+  try:
+    return _detect(
+      candlestick_data,
+      trend_type,
+      first_pt_must_be_pivot,
+      last_pt_must_be_pivot,
+      all_pts_must_be_pivots,
+      trendline_must_include_global_maxmin_pt,
+      min_points_required,
+      scan_from_date,
+      ignore_breakouts,
+      config,
+      debug,
+    )
+  finally:
+    candlestick_data._avg_candle_range = None
+
+def _detect(
+  candlestick_data,
+  trend_type,
+  first_pt_must_be_pivot,
+  last_pt_must_be_pivot,
+  all_pts_must_be_pivots,
+  trendline_must_include_global_maxmin_pt,
+  min_points_required,
+  scan_from_date,
+  ignore_breakouts,
+  config,
+  debug,
+):
+  # Process config once, shared by support and resistance passes
+  max_allowable_error_pt_to_trend = config.get("max_allowable_error_pt_to_trend", DEFAULT_CONFIG["max_allowable_error_pt_to_trend"])(candlestick_data)
+  breakout_tolerance = config.get("breakout_tolerance", DEFAULT_CONFIG["breakout_tolerance"])(candlestick_data)
+  max_allowable_support_slope = config.get("max_allowable_support_slope", DEFAULT_CONFIG["max_allowable_support_slope"])(candlestick_data)
+  min_allowable_support_slope = config.get("min_allowable_support_slope", DEFAULT_CONFIG["min_allowable_support_slope"])(candlestick_data)
+  max_allowable_resistance_slope = config.get("max_allowable_resistance_slope", DEFAULT_CONFIG["max_allowable_resistance_slope"])(candlestick_data)
+  min_allowable_resistance_slope = config.get("min_allowable_resistance_slope", DEFAULT_CONFIG["min_allowable_resistance_slope"])(candlestick_data)
+  max_allowable_support_last_price = config.get("max_allowable_support_last_price", DEFAULT_CONFIG["max_allowable_support_last_price"])(candlestick_data)
+  min_allowable_support_last_price = config.get("min_allowable_support_last_price", DEFAULT_CONFIG["min_allowable_support_last_price"])(candlestick_data)
+  max_allowable_resistance_last_price = config.get("max_allowable_resistance_last_price", DEFAULT_CONFIG["max_allowable_resistance_last_price"])(candlestick_data)
+  min_allowable_resistance_last_price = config.get("min_allowable_resistance_last_price", DEFAULT_CONFIG["min_allowable_resistance_last_price"])(candlestick_data)
+
+  avg_candle_range = util.avg_candle_range(candlestick_data)
+
+  # Candle dates, looked up by position when building trendline rows
+  candle_dates = candlestick_data.df['Date'].tolist()
+
   def detect_wrapped(tt):
     '''
     The algorithm will fly through all N^2 pivot point pairs,
@@ -160,28 +220,11 @@ def detect(
 
     '''
     # Input validation
-    if candlestick_data == None:
-      raise Exception("No candlestick data provided")
-    elif type(candlestick_data) != structs.CandlestickData:
-      raise Exception("candlestick_data input provided is of invalid type. See README for instructions")
-
     if tt == None:
       raise Exception("No trend_type data provided")
     elif type(tt) != str:
       raise Exception("trend_type input provided is of invalid type. See README for instructions")
 
-    # Process config
-    max_allowable_error_pt_to_trend = config.get("max_allowable_error_pt_to_trend", DEFAULT_CONFIG["max_allowable_error_pt_to_trend"])(candlestick_data)
-    breakout_tolerance = config.get("breakout_tolerance", DEFAULT_CONFIG["breakout_tolerance"])(candlestick_data)
-    max_allowable_support_slope = config.get("max_allowable_support_slope", DEFAULT_CONFIG["max_allowable_support_slope"])(candlestick_data)
-    min_allowable_support_slope = config.get("min_allowable_support_slope", DEFAULT_CONFIG["min_allowable_support_slope"])(candlestick_data)
-    max_allowable_resistance_slope = config.get("max_allowable_resistance_slope", DEFAULT_CONFIG["max_allowable_resistance_slope"])(candlestick_data)
-    min_allowable_resistance_slope = config.get("min_allowable_resistance_slope", DEFAULT_CONFIG["min_allowable_resistance_slope"])(candlestick_data)
-    max_allowable_support_last_price = config.get("max_allowable_support_last_price", DEFAULT_CONFIG["max_allowable_support_last_price"])(candlestick_data)
-    min_allowable_support_last_price = config.get("min_allowable_support_last_price", DEFAULT_CONFIG["min_allowable_support_last_price"])(candlestick_data)
-    max_allowable_resistance_last_price = config.get("max_allowable_resistance_last_price", DEFAULT_CONFIG["max_allowable_resistance_last_price"])(candlestick_data)
-    min_allowable_resistance_last_price = config.get("min_allowable_resistance_last_price", DEFAULT_CONFIG["min_allowable_resistance_last_price"])(candlestick_data)
-
     max_allowable_slope = max_allowable_support_slope if tt == structs.TrendlineTypes.SUPPORT else max_allowable_resistance_slope
     min_allowable_slope = min_allowable_support_slope if tt == structs.TrendlineTypes.SUPPORT else min_allowable_resistance_slope
     max_allowable_last_price = max_allowable_support_last_price if tt == structs.TrendlineTypes.SUPPORT else max_allowable_resistance_last_price
@@ -204,8 +247,6 @@ def detect(
     pivots_sorted = list(pivots)
     pivots_sorted.sort()
 
-    avg_candle_range = util.avg_candle_range(candlestick_data)
-
     # Threshold to decide max difference from a global max/min and consecutive best next global max/min to both be considered
     max_or_min_capture_thres = avg_candle_range * 0.10
     global_max_or_mins = []
@@ -213,9 +254,12 @@ def detect(
       global_max_or_mins = util.find_maxs_or_mins_in_series(pseries_sub, "max", max_or_min_capture_thres)
     else:
       global_max_or_mins = util.find_maxs_or_mins_in_series(pseries_sub, "min", max_or_min_capture_thres)
+    global_max_or_mins_set = set(global_max_or_mins)
 
     # Trendlines is a pandas dataframe containing columns ( slice_of_points, num_points, slope, intercept, score)
-    trends_df = pd.DataFrame(columns=[
+    # Rows are collected in trend_rows and the dataframe is built once after the scan
+    trend_rows = []
+    trend_columns = [
       'id',
       'trendtype',
       'pointset_indeces',
@@ -240,7 +284,16 @@ def detect(
       'is_best_from_duplicate_group',
       'overall_rank',
       'rank_within_group',
-    ])
+    ]
+
+    # Pointset ids already added to trend_rows
+    seen_pointset_ids = set([])
+
+    # Candle prices and pivot flags as arrays, so each candidate line is checked against all candles at once
+    candle_prices = candlestick_data.df[col].to_numpy()
+    candle_indeces = np.arange(len(pseries))
+    is_pivot = np.zeros(len(candle_prices), dtype=bool)
+    is_pivot[list(pivots)] = True
     
     for i in range(0, len(pseries)):
       # If we only specify using pivot points as start, skip non pivots
@@ -251,6 +304,22 @@ def detect(
       if scan_from_index > i:
         continue
 
+      # Candles after i that may become points of a trendline starting at i
+      candidate_indeces = candle_indeces[i+1:]
+      if last_pt_must_be_pivot:
+        candidate_indeces = candidate_indeces[is_pivot[candidate_indeces]]
+      candidate_prices = candle_prices[candidate_indeces]
+
+      # Prices a line must cross at each candidate to count as a breakout don't depend on j
+      if tt == structs.TrendlineTypes.RESISTANCE:
+        breakout_prices = candidate_prices - breakout_tolerance
+      else:
+        breakout_prices = candidate_prices + breakout_tolerance
+
+      # Trendline prices and errors at the candidate candles, written in place for every j
+      trend_prices = np.empty(len(candidate_indeces))
+      trend_errors = np.empty(len(candidate_indeces))
+
       for j in range(i+1, len(pseries)):
         # If we only specify using pivot points as end, skip non pivots
         if (last_pt_must_be_pivot or all_pts_must_be_pivots) and j not in pivots:
@@ -276,37 +345,37 @@ def detect(
           continue
 
         # Determine breakouts + count the number of points within this trendline
-        num_points = 2
-        points_in_trendline = [i, j]
-        prices_in_trendline = [m * i + b, m * j + b]
+        # (j is skipped because it is already a point in the set)
+        np.multiply(candidate_indeces, m, out=trend_prices)
+        trend_prices += b
+        j_position = np.searchsorted(candidate_indeces, j)
+
+        if tt == structs.TrendlineTypes.RESISTANCE:
+          breakouts = trend_prices < breakout_prices
+        else:
+          breakouts = trend_prices > breakout_prices
+        breakouts[j_position] = False
+
         is_breakout = False
         breakout_index = None
         breakout_date = None
-
-        for k in range(i, len(pseries)):
-          if last_pt_must_be_pivot and k not in pivots:
-            continue
-
-          # Skip checking for the i or j case because these are already points in the set
-          if k == i or k == j:
-            continue
-
-          trend_price_at_k = m * k + b
-
-          # Determine if this trend is a breakout, if it hasn't been identified as one already
-          if not is_breakout:
-            if tt == structs.TrendlineTypes.RESISTANCE and trend_price_at_k < pseries[k] - breakout_tolerance or \
-                tt == structs.TrendlineTypes.SUPPORT and trend_price_at_k > pseries[k] + breakout_tolerance:
-
-              breakout_index = k
-              breakout_date = candlestick_data.df.iloc[i].Date
-              is_breakout = True
-            
-
-          if abs(trend_price_at_k - pseries[k]) < max_allowable_error_pt_to_trend:
-            num_points += 1
-            points_in_trendline.append(k)
-            prices_in_trendline.append(trend_price_at_k)
+        breakout_positions = np.flatnonzero(breakouts)
+        if len(breakout_positions) > 0:
+          # We ignore this i,j pair if this is a breakout. Every other check below only rejects
+          # lines, so there is no need to count points or build the pointset id first
+          if ignore_breakouts: continue
+
+          breakout_index = int(candidate_indeces[breakout_positions[0]])
+          breakout_date = candle_dates[i]
+          is_breakout = True
+
+        np.subtract(trend_prices, candidate_prices, out=trend_errors)
+        np.abs(trend_errors, out=trend_errors)
+        within_error = trend_errors < max_allowable_error_pt_to_trend
+        within_error[j_position] = False
+        num_points = 2 + int(np.count_nonzero(within_error))
+        points_in_trendline = [i, j] + candidate_indeces[within_error].tolist()
+        prices_in_trendline = [m * i + b, m * j + b] + trend_prices[within_error].tolist()
 
         # Check if we have the minimum required number of points for trend
         if num_points < min_points_required: continue
@@ -320,19 +389,13 @@ def detect(
         pointset_id = ("R" if tt == structs.TrendlineTypes.RESISTANCE else "S") + "-" + points_in_trendline_str
 
         # Determine if trendline has max or min, and skip this line if we require our lines have global max or min
-        global_pt_found = False
-        for p in points_in_trendline:
-          if p in global_max_or_mins:
-            global_pt_found = True
+        global_pt_found = not global_max_or_mins_set.isdisjoint(points_in_trendline)
 
         if trendline_must_include_global_maxmin_pt and not global_pt_found:
           continue
 
         # We already have this pointset, just different order
-        if pointset_id in trends_df.id.values: continue
-
-        # We ignore this i,j pair if this is a breakout
-        if is_breakout and ignore_breakouts: continue
+        if pointset_id in seen_pointset_ids: continue
 
         # Scoring
         err_distances = []
@@ -344,15 +407,16 @@ def detect(
         
         score = config.get("scoring_function", DEFAULT_CONFIG["scoring_function"])(candlestick_data, err_distances, num_points, slope)
         
-        trends_df.loc[len(trends_df.index)] = [
+        seen_pointset_ids.add(pointset_id)
+        trend_rows.append([
             pointset_id,
             tt,
             points_in_trendline,
-            [candlestick_data.df.iloc[pt].Date for pt in points_in_trendline],
+            [candle_dates[pt] for pt in points_in_trendline],
             points_in_trendline[0],
-            candlestick_data.df.iloc[points_in_trendline[0]].Date,
+            candle_dates[points_in_trendline[0]],
             points_in_trendline[-1],
-            candlestick_data.df.iloc[points_in_trendline[-1]].Date,
+            candle_dates[points_in_trendline[-1]],
             is_breakout,
             breakout_index,
             breakout_date,
@@ -368,7 +432,13 @@ def detect(
             None,
             False,
             None,
-            0]
+            0])
+
+    trends_df = pd.DataFrame(trend_rows, columns=trend_columns)
+
+    # Breakout indeces as ints, or None when there is no breakout
+    breakout_index_col = trend_columns.index('breakout_index')
+    trends_df['breakout_index'] = pd.Series([row[breakout_index_col] for row in trend_rows], dtype=object)
 
     # Mark which of the trendlines are duplicate
     trends_df = _mark_duplicates(trends_df, candlestick_data, tt, config)
@@ -427,53 +497,45 @@ def _mark_duplicates(trends_df, candlestick_data, trend_type, config):
   group_idx = 1000 if trend_type == structs.TrendlineTypes.RESISTANCE else 2000
 
   # 2D clustering last price and slope to find closely related trendlines
+  # Candidate matches for each row are found with array masks over all rows, and groups are
+  # tracked in an array that is written back to trends_df once clustering is done
+  last_prices = trends_df['price_at_last_date'].to_numpy(dtype=float)
+  slope_angles = trends_df['slope'].to_numpy(dtype=float)
+  breakouts = trends_df['is_breakout'].to_numpy(dtype=bool)
+
+  group_ids = trends_df['duplicate_group_id'].to_numpy(dtype=object).copy()
+
   for i in range(0, len(trends_df)):
-    best_matching_idx = -1
-    row_i = trends_df.iloc[i]
-    row_last_price = row_i['price_at_last_date']
-    row_slope_angle = row_i['slope']
-    i_is_breakout = row_i['is_breakout']
-
-    for j in range(0, len(trends_df)):
-      if i==j: continue
-
-      row_j = trends_df.iloc[j]
-      sec_row_last_price = row_j['price_at_last_date']
-      sec_row_slope_angle = row_j['slope']
-      j_is_breakout = row_j['is_breakout']
-
-      price_diff = abs(row_last_price - sec_row_last_price)
-      slope_angle_diff = abs(row_slope_angle - sec_row_slope_angle)
-
-      # We determine that row i and row j are a good match for same group
-      if ((price_diff < duplicate_grouping_threshold_last_price) and (slope_angle_diff < duplicate_grouping_threshold_slope)) \
-          and (i_is_breakout == j_is_breakout):
-        best_matching_idx = j
-        break
+    price_diff = np.abs(last_prices[i] - last_prices)
+    slope_angle_diff = np.abs(slope_angles[i] - slope_angles)
 
-    if(best_matching_idx != -1):
-      this_row = row_i
-      best_matching_row = trends_df.iloc[best_matching_idx]
+    # We determine that row i and row j are a good match for same group
+    is_match = (price_diff < duplicate_grouping_threshold_last_price) & (slope_angle_diff < duplicate_grouping_threshold_slope) \
+      & (breakouts == breakouts[i])
+    is_match[i] = False
+    matches = np.flatnonzero(is_match)
 
-      this_row_group = this_row['duplicate_group_id']
-      best_matching_row_group = best_matching_row['duplicate_group_id']
+    if len(matches) > 0:
+      best_matching_idx = matches[0]
+
+      this_row_group = group_ids[i]
+      best_matching_row_group = group_ids[best_matching_idx]
 
       group_id_for_pair = best_matching_row_group if best_matching_row_group is not None else group_idx
 
       if best_matching_row_group == None:
-        trends_df.loc[best_matching_row.name, 'duplicate_group_id'] = group_id_for_pair
+        group_ids[best_matching_idx] = group_id_for_pair
 
       if this_row_group == None:
-        trends_df.loc[this_row.name, 'duplicate_group_id'] = group_id_for_pair
+        group_ids[i] = group_id_for_pair
       else:
-        for k in range(0, len(trends_df)):
-          row_k = trends_df.iloc[k]
-          if row_k['duplicate_group_id'] == this_row_group:
-            trends_df.loc[row_k.name, 'duplicate_group_id'] = group_id_for_pair
+        group_ids[group_ids == this_row_group] = group_id_for_pair
 
     else:
-      trends_df.loc[row_i.name, 'duplicate_group_id'] = group_idx
+      group_ids[i] = group_idx
     group_idx += 1
+
+  trends_df['duplicate_group_id'] = group_ids
   
   # For all the duplicate groups found, mark best for each group
   if(len(trends_df) == 1):
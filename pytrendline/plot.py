@@ -5,7 +5,7 @@ import numpy as np
 from bokeh.resources import CDN
 from bokeh.models.widgets import Div
 from bokeh.plotting import figure
-from bokeh.models import Label
+from bokeh.models import Label, ColumnDataSource
 from bokeh.embed import file_html
 
 from datetime import timedelta
@@ -72,6 +72,7 @@ class TrendlineFigure():
     self.type = trend_type
 
     self.id = result_row['id']
+    self.pointset_indeces = result_row['pointset_indeces']
     self.pointset_dates = result_row['pointset_dates']
     self.breakout_index = result_row['breakout_index']
     self.is_breakout = result_row['is_breakout']
@@ -82,23 +83,30 @@ class TrendlineFigure():
     self.plotting_prop_overrides = plotting_prop_overrides
 
   def plot_figure(self, p, candles_df, opts={}):    
-    pointset_indeces = []
-    for date in self.pointset_dates:
-      pointset_indeces.append( candles_df.loc[candles_df['Date'] == date].index[0] )
-
-    pt_set_y = []
-    pt_set_x = pointset_indeces
-
-    for pt in pt_set_x:
-      if self.type == structs.TrendlineTypes.RESISTANCE:
-        pt_set_y.append(candles_df.iloc[pt].High)
-      elif self.type == structs.TrendlineTypes.SUPPORT:
-        pt_set_y.append(candles_df.iloc[pt].Low)
-      else:
-        pt_set_y.append(candles_df.iloc[pt].Low)
+    # Draws the trendline, breakout and score label. The points that make up the trendline are
+    # not marked here: they are returned as (x, y, color) for the caller to mark
+
+    # Positions of the candles at each trendline point, from the candles_df index labels detect found
+    # them at. If those don't point at the trendline dates (candles_df is not the frame detected on),
+    # the first candle at each date is used instead
+    pointset_positions = _first_positions(candles_df.index, list(self.pointset_indeces))
+    if (pointset_positions < 0).any() or \
+      candles_df['Date'].iloc[pointset_positions].tolist() != list(self.pointset_dates):
+      pointset_positions = _first_positions(candles_df['Date'], self.pointset_dates)
+
+    # Drop dates that are not candles of candles_df (marked -1), and skip
+    # lines whose remaining points span no candles, as these would be vertical with no usable slope
+    pointset_positions = pointset_positions[pointset_positions >= 0]
+    if len(pointset_positions) < 2 or pointset_positions[-1] == pointset_positions[0]:
+      return [], [], self.get_trendline_plot_color()
+
+    col = "High" if self.type == structs.TrendlineTypes.RESISTANCE else "Low"
+    pt_set_x = pointset_positions.tolist()
+    pt_set_y = candles_df[col].to_numpy()[pointset_positions].tolist()
 
     # Calculate slope and intersect using first point and last point
-    m, b = np.polyfit([pt_set_x[0], pt_set_x[-1]], [pt_set_y[0], pt_set_y[-1]], 1)
+    m = (pt_set_y[-1] - pt_set_y[0]) / (pt_set_x[-1] - pt_set_x[0])
+    b = pt_set_y[0] - m * pt_set_x[0]
 
     if self.is_breakout:
       last_date_index = self.breakout_index + 0.05
@@ -145,20 +153,8 @@ class TrendlineFigure():
       )
       p.add_layout(label)
 
-    # Mark points that make up trendline
-    p.square(pt_set_x, tl_vals_at_x, size=12, color=color, alpha=0.5)
-
-    # Mark global maxs or mins
-    for date in self.global_maxs_or_mins:
-      query = candles_df.loc[candles_df['Date'] == date]
-      if len(query) == 0: continue
-      index = query.iloc[0].name
-
-      if self.type == structs.TrendlineTypes.RESISTANCE:
-        price = candles_df.iloc[index].High
-      elif self.type == structs.TrendlineTypes.SUPPORT:
-        price = candles_df.iloc[index].Low
-      p.circle(index, price, size=20, color="gold", alpha=0.3)
+    # Points that make up trendline
+    return pt_set_x, tl_vals_at_x, color
 
   def get_trendtype_string(self):
     if self.type == structs.TrendlineTypes.RESISTANCE:
@@ -216,17 +212,27 @@ class TrendlineFigure():
 def _draw_bidirectional_ray(p, x, y, angle, color, width=2, dash="dashed"):
   p.segment(x0=x, x1=x, y0=0, y1=10000, line_color=color, line_dash=dash, line_width=width)
 
+def _first_positions(keys, values):
+  # Position of the first occurrence of each value in keys, -1 for values not in keys
+  keys = pd.Index(keys)
+  is_first = ~keys.duplicated()
+  positions = pd.Series(np.flatnonzero(is_first), index=keys[is_first])
+  return positions.reindex(values).fillna(-1).to_numpy(dtype=int)
+
 def _highlight_pivots(p, pivots_indexes, col, candles_df):
-  # Highlight pivot points
-  pivots_x_vals = []
-  pivots_y_vals = []
-  for pivot_idx in pivots_indexes:
-    pivot_panda_ts = candles_df.iloc[pivot_idx].name
-    pivot_y_val = candles_df.iloc[pivot_idx][col]
-    pivots_x_vals.append(pivot_panda_ts)
-    pivots_y_vals.append(pivot_y_val)
+  # Highlight pivot points (given as candles_df index labels) at their candle positions
+  pivots_x_vals = _first_positions(candles_df.index, list(pivots_indexes))
+  pivots_x_vals = pivots_x_vals[pivots_x_vals >= 0]
+  pivots_y_vals = candles_df[col].to_numpy()[pivots_x_vals]
   p.diamond(pivots_x_vals, pivots_y_vals, size=20, line_color="green", fill_alpha=0.1, alpha=0.5)
 
+def _highlight_global_maxs_or_mins(p, global_maxs_or_mins, col, candles_df):
+  # Mark global maxs or mins (given as candles_df index labels) at their candle positions
+  global_x_vals = _first_positions(candles_df.index, list(global_maxs_or_mins))
+  global_x_vals = global_x_vals[global_x_vals >= 0]
+  global_y_vals = candles_df[col].to_numpy()[global_x_vals]
+  p.scatter(global_x_vals, global_y_vals, marker="circle", size=20, color="gold", alpha=0.3)
+
 def plot_graph_bokeh(results):
   candlestick_data = results["candlestick_data"]
 
@@ -248,8 +254,10 @@ def plot_graph_bokeh(results):
   
   
   # Plot candlestick chart
-  inc = candles_df.Close > candles_df.Open
-  dec = candles_df.Open > candles_df.Close
+  open_prices = candles_df.Open.to_numpy()
+  close_prices = candles_df.Close.to_numpy()
+  inc = close_prices > open_prices
+  dec = open_prices > close_prices
   w = 0.5
 
   p = figure(
@@ -261,31 +269,46 @@ def plot_graph_bokeh(results):
     x_range=(x_range_left, x_range_right),
   )
   
-  p.xaxis.major_label_overrides = {
-    i: date.strftime('%b %d %H:%M') for i, date in enumerate(candles_df['Date'])
-  }
+  # Label each candle position with its date
+  p.xaxis.major_label_overrides = dict(enumerate(candles_df['Date'].dt.strftime('%b %d %H:%M')))
 
   p.xaxis.major_label_orientation = pi/4
   p.grid.grid_line_alpha=0.3
-  p.segment(candles_df.index, candles_df.High, candles_df.index, candles_df.Low, color="black")
-  p.vbar(candles_df.index[inc], w, candles_df.Open[inc], candles_df.Close[inc], fill_color="#D5E1DD", line_color="black")
-  p.vbar(candles_df.index[dec], w, candles_df.Open[dec], candles_df.Close[dec], fill_color="#F2583E", line_color="black")
-
-  # Plot trendlines (support)
-  if 'support_trendlines' in results:
-    for _, result_row in results['support_trendlines'].iterrows():
-      tf = TrendlineFigure(structs.TrendlineTypes.SUPPORT, result_row)
-      tf.plot_figure(p, candles_df)
-
-  # Plot trendlines (resistsance)
-  if 'resistance_trendlines' in results:
-    for _, result_row in results['resistance_trendlines'].iterrows():
-      tf = TrendlineFigure(structs.TrendlineTypes.RESISTANCE, result_row)
-      tf.plot_figure(p, candles_df)
+
+  # Candles are drawn at their integer position
+  candle_x = np.arange(len(candles_df))
+  candle_src = ColumnDataSource(dict(x=candle_x, High=candles_df.High.to_numpy(), Low=candles_df.Low.to_numpy()))
+
+  p.segment(x0='x', y0='High', x1='x', y1='Low', source=candle_src, color="black")
+
+  # Candle bodies for increasing and decreasing candles
+  inc_src = ColumnDataSource(dict(x=candle_x[inc], Open=open_prices[inc], Close=close_prices[inc]))
+  dec_src = ColumnDataSource(dict(x=candle_x[dec], Open=open_prices[dec], Close=close_prices[dec]))
+
+  p.vbar(x='x', width=w, top='Open', bottom='Close', source=inc_src, fill_color="#D5E1DD", line_color="black")
+  p.vbar(x='x', width=w, top='Open', bottom='Close', source=dec_src, fill_color="#F2583E", line_color="black")
+
+  # Plot trendlines (support and resistance), gathering the points of all of them
+  marker_x, marker_y, marker_color = [], [], []
+  for results_key, trend_type in [
+    ('support_trendlines', structs.TrendlineTypes.SUPPORT),
+    ('resistance_trendlines', structs.TrendlineTypes.RESISTANCE),
+  ]:
+    if results_key not in results: continue
+    for _, result_row in results[results_key].iterrows():
+      tf = TrendlineFigure(trend_type, result_row)
+      pts_x, pts_y, color = tf.plot_figure(p, candles_df)
+      marker_x.extend(pts_x)
+      marker_y.extend(pts_y)
+      marker_color.extend([color] * len(pts_x))
+
+  # Mark points that make up trendlines
+  markers_src = ColumnDataSource(dict(x=marker_x, y=marker_y, color=marker_color))
+  p.scatter(x='x', y='y', source=markers_src, marker="square", size=12, color='color', alpha=0.5)
 
   # Draw vertical lines at first and last price
-  _draw_bidirectional_ray(p, candles_df.index[0] - 0.5, 0, 90, "#bbbbbb")
-  _draw_bidirectional_ray(p, candles_df.index[-1] + 0.5, 0, 90, "#bbbbbb")
+  _draw_bidirectional_ray(p, candle_x[0] - 0.5, 0, 90, "#bbbbbb")
+  _draw_bidirectional_ray(p, candle_x[-1] + 0.5, 0, 90, "#bbbbbb")
 
 
   # Highlight pivot points
@@ -294,6 +317,12 @@ def plot_graph_bokeh(results):
   if 'resistance_pivots' in results:
     _highlight_pivots(p, results['resistance_pivots'], "High", candles_df)
 
+  # Mark global maxs or mins, shared by every trendline of a trend type
+  if 'support_trendlines' in results and len(results['support_trendlines']) > 0:
+    _highlight_global_maxs_or_mins(p, results['support_trendlines'].iloc[0]['global_maxs_or_mins'], "Low", candles_df)
+  if 'resistance_trendlines' in results and len(results['resistance_trendlines']) > 0:
+    _highlight_global_maxs_or_mins(p, results['resistance_trendlines'].iloc[0]['global_maxs_or_mins'], "High", candles_df)
+
   # Styling nits
   p.title.text_font_size = '16pt'
 
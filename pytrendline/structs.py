@@ -60,10 +60,8 @@ class CandlestickData():
           datetime_col, df[datetime_col].dtypes
         ))
 
-    # Instantiate
-    self.df = df.copy(deep=True)
-
-    self.df = self.df.rename(columns={
+    # Instantiate (rename returns a copy of df)
+    self.df = df.rename(columns={
       open_col: "Open",
       high_col: "High",
       low_col: "Low",
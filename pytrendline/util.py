@@ -14,8 +14,12 @@ def find_maxs_or_mins_in_series(series, kind, tolerance_threshold):
       isolated_globals.append(idx)
   return isolated_globals
 
-# Find the average distance between High and Low price in a set of candles
+# Find the average distance between High and Low price in a set of candles.
+# Config callables ask for this many times per detect, so detect caches it on
+# the CandlestickData instance for the duration of the call
 def avg_candle_range(candles):
+  cached_range = getattr(candles, '_avg_candle_range', None)
+  if cached_range is not None: return cached_range
   return max((candles.df.High - candles.df.Low).mean(), 0.01)
 
 # Find mean in a list of int or floats
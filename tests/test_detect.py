@@ -1,12 +1,16 @@
 import os
+import pathlib
+import webbrowser
 
 # Core lib
 import pandas as pd
 from dataclasses import dataclass
+from bokeh.plotting import figure
 
 
 # Lib imports
-from pytrendline import structs, detect, plot
+from pytrendline import structs, util, detect, plot
+from pytrendline.plot import TrendlineFigure, plot_graph_bokeh
 from fixtures import testcases
 
 @dataclass
@@ -151,6 +155,22 @@ def test_findtrends():
       "expect_err": False,
       # "open_plot": True # Uncomment to see bokeh result in browser
     },
+    {
+      "name": "One flat support and one flat resistance with breakout lines [breakouts enabled]",
+      "candles": testcases.FLAT_RES_AND_SUP,
+      "time_interval": '1d',
+      "result_assert": ResultAssert(
+        [
+          TrendlineAssert("SUPPORT", "S-[0,3,5]", True, 1, 1, 1),
+          TrendlineAssert("SUPPORT", "S-[1,2,4]", False, 0, 2, 1),
+          TrendlineAssert("RESISTANCE", "R-[0,2,4]", True, 1, 1, 1),
+          TrendlineAssert("RESISTANCE", "R-[1,3,5]", False, 0, 2, 1),
+        ], 4
+      ),
+      "breakout_enabled": True,
+      "expect_err": False,
+      # "open_plot": True # Uncomment to see bokeh result in browser
+    },
     {
       "name": "One res line with global max/min pt, search globals only",
       "candles": testcases.ONE_RES_LINE_WITH_GLOBAL_MAX_1d,
@@ -162,7 +182,7 @@ def test_findtrends():
         ], 1
       ),
       "expect_err": False,
-      "open_plot": True # Uncomment to see bokeh result in browser
+      # "open_plot": True # Uncomment to see bokeh result in browser
     },
     {
       "name": "One res line with global max/min pt, search all",
@@ -233,7 +253,10 @@ def test_findtrends():
         filedir='.',
         filename='test_output.html',
       )
-      os.system("open " + outf)
+      webbrowser.open(pathlib.Path(outf).resolve().as_uri())
+
+    # Check breakout indeces stay ints, with None for non-breakouts, rather than being upcast to float
+    assert all_results_df["breakout_index"].dtype == object, "Expected breakout_index column to be of object dtype, received {}".format(all_results_df["breakout_index"].dtype)
 
     # Check number of groups and number of trendlines ok
     assert num_groups == asserts.number_of_groups, "Expected number of groups in result to be {}, received {}".format(asserts.number_of_groups, num_groups)
@@ -256,6 +279,127 @@ def test_findtrends():
 
       assert result_trend["trendtype"] == trend.trend_type, "Expected trend with id {} to have trend type '{}', received '{}'".format(trend.trend_id, trend.trend_type, result_trend["trendtype"])
       assert result_trend["is_breakout"] == trend.is_breakout, "Expected trend with id {} to have is_breakout={}".format(trend.trend_id, trend.is_breakout)
-      if trend.is_breakout: assert result_trend["breakout_index"] == trend.breakout_index, "Expected trend with id {} to have breakout index at {}".format(trend.trend_id, trend.breakout_index)
+      if trend.is_breakout: assert type(result_trend["breakout_index"]) == int and result_trend["breakout_index"] == trend.breakout_index, "Expected trend with id {} to have int breakout index at {}, received {!r}".format(trend.trend_id, trend.breakout_index, result_trend["breakout_index"])
+      else: assert result_trend["breakout_index"] is None, "Expected trend with id {} to have no breakout index, received {}".format(trend.trend_id, result_trend["breakout_index"])
       assert result_trend["overall_rank"] == trend.overall_rank, "Expected trend with id {} to have overall_rank of {}, received {}".format(trend.trend_id, trend.overall_rank, result_trend["overall_rank"])
       assert result_trend["rank_within_group"] == trend.rank_within_group, "Expected trend with id {} to have rank_within_group of {}".format(trend.trend_id, trend.rank_within_group)
+
+
+def test_plot_duplicate_dates(tmp_path):
+  candles = testcases.DUPLICATE_DATE_1d
+  results = detect(
+    candlestick_data=candles,
+    trend_type=structs.TrendlineTypes.BOTH,
+    first_pt_must_be_pivot=False,
+    last_pt_must_be_pivot=False,
+    all_pts_must_be_pivots=False,
+    trendline_must_include_global_maxmin_pt=False,
+    min_points_required=3,
+    scan_from_date=None,
+    ignore_breakouts=True,
+    config={
+      "max_allowable_error_pt_to_trend": lambda candles: 0.10,
+      "duplicate_grouping_threshold_last_price": lambda candles: 0.40,
+    }
+  )
+
+  # Trendline through the repeated date is plotted at the candles it was detected at
+  result_row = results['support_trendlines'].iloc[0]
+  assert result_row['id'] == "S-[1,2,4]"
+  pts_x, pts_y, _ = TrendlineFigure(structs.TrendlineTypes.SUPPORT, result_row).plot_figure(figure(), candles.df)
+  assert pts_x == [1, 2, 4], "Expected trendline points at candles [1, 2, 4], received {}".format(pts_x)
+  assert pts_y == candles.df['Low'].iloc[[1, 2, 4]].tolist(), "Expected trendline points at the Low of candles [1, 2, 4], received {}".format(pts_y)
+
+  # Trendline spanning only the two candles of the repeated date is still plotted
+  result_row = result_row.copy()
+  result_row['pointset_indeces'] = [1, 2]
+  result_row['pointset_dates'] = candles.df['Date'].iloc[[1, 2]].tolist()
+  pts_x, _, _ = TrendlineFigure(structs.TrendlineTypes.SUPPORT, result_row).plot_figure(figure(), candles.df)
+  assert pts_x == [1, 2], "Expected trendline points at candles [1, 2], received {}".format(pts_x)
+
+  assert os.path.exists(plot(results=results, filedir=str(tmp_path), filename='test_output.html'))
+
+
+def test_avg_candle_range_follows_df():
+  candles = structs.CandlestickData(
+    df=testcases.FLAT_RES_AND_SUP.df,
+    time_interval='1d',
+    open_col="Open",
+    high_col="High",
+    low_col="Low",
+    close_col="Close",
+    datetime_col="Date"
+  )
+  detect(candlestick_data=candles, trend_type=structs.TrendlineTypes.BOTH)
+  before = util.avg_candle_range(candles)
+
+  # Changing df in place after detect must not reuse the range computed during detect
+  candles.df['High'] = candles.df['High'] * 3
+  after = util.avg_candle_range(candles)
+  assert after == max((candles.df.High - candles.df.Low).mean(), 0.01), "Expected avg_candle_range to be computed from the updated df, received {}".format(after)
+  assert after != before
+
+  # Same for reassigning df
+  candles.df = candles.df.assign(High=candles.df.High * 3)
+  assert util.avg_candle_range(candles) == max((candles.df.High - candles.df.Low).mean(), 0.01), "Expected avg_candle_range to be computed from the reassigned df"
+
+
+def test_plot_marks_pivots_and_globals_at_candle_positions():
+  results = detect(
+    candlestick_data=testcases.FLAT_RES_AND_SUP,
+    trend_type=structs.TrendlineTypes.SUPPORT,
+    first_pt_must_be_pivot=False,
+    last_pt_must_be_pivot=False,
+    all_pts_must_be_pivots=False,
+    trendline_must_include_global_maxmin_pt=False,
+    min_points_required=3,
+    scan_from_date=None,
+    ignore_breakouts=False,
+    config={
+      "max_allowable_error_pt_to_trend": lambda candles: 0.10,
+      "duplicate_grouping_threshold_last_price": lambda candles: 0.40,
+    }
+  )
+
+  # Both support trendlines (one of them a breakout) share a single set of global mins
+  assert len(results['support_trendlines']) == 2
+
+  p = plot_graph_bokeh(results)
+  marked_x = {'circle': [], 'diamond': []}
+  for renderer in p.renderers:
+    marker = getattr(renderer.glyph, 'marker', None)
+    if marker in marked_x: marked_x[marker].append(sorted(renderer.data_source.data['x'].tolist()))
+
+  assert marked_x['circle'] == [[1, 2, 4]], "Expected global mins marked once at candles [1, 2, 4], received {}".format(marked_x['circle'])
+  assert marked_x['diamond'] == [[0, 1, 2, 4, 5]], "Expected pivots marked at candles [0, 1, 2, 4, 5], received {}".format(marked_x['diamond'])
+
+
+def test_plot_trendline_with_dates_missing_from_candles():
+  candles_df = testcases.FLAT_RES_AND_SUP.df
+  missing_date = candles_df['Date'].iloc[-1] + pd.Timedelta(days=1)
+  result_row = {
+    'id': "S-[1,2,4]",
+    # Index 6 is not a candle of candles_df, so points are looked up by date
+    'pointset_indeces': [1, 2, 4, 6],
+    'pointset_dates': [candles_df['Date'].iloc[1], candles_df['Date'].iloc[2], candles_df['Date'].iloc[4], missing_date],
+    'breakout_index': None,
+    'is_breakout': False,
+    'score': 1.0,
+    'includes_global_max_or_min': True,
+    'global_maxs_or_mins': [1, 2, 4],
+    'is_best_from_duplicate_group': True,
+  }
+
+  # Missing date is dropped, the rest of the trendline is still plotted
+  p = figure()
+  pts_x, _, _ = TrendlineFigure(structs.TrendlineTypes.SUPPORT, result_row).plot_figure(p, candles_df)
+  assert pts_x == [1, 2, 4], "Expected trendline points at candles [1, 2, 4], received {}".format(pts_x)
+  assert len(p.renderers) > 0
+
+  # Trendline left with a single candle is skipped, nothing is drawn for it
+  result_row['pointset_indeces'] = [1, 6]
+  result_row['pointset_dates'] = [candles_df['Date'].iloc[1], missing_date]
+  p = figure()
+  pts_x, _, _ = TrendlineFigure(structs.TrendlineTypes.SUPPORT, result_row).plot_figure(p, candles_df)
+  assert pts_x == [], "Expected no trendline points, received {}".format(pts_x)
+  assert len(p.renderers) == 0